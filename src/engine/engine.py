@@ -1,7 +1,10 @@
+import concurrent.futures
 import datetime
 import math
+import queue
 import random
 import sys
+import threading
 import time
 
 from src.engine.settings import SettingsMenu, EndGameMenu
@@ -23,6 +26,28 @@ import platform
 
 
 EVAL_ON = False
+# number of rendered text surfaces kept before the cache is emptied
+TEXT_CACHE_SIZE = 256
+# seconds to wait before the engine plays its move
+AI_MOVE_DELAY = 0.15
+
+# row a pawn promotes on, keyed by pawn direction
+_PROMOTION_ROW = {1: 7, -1: 0}
+# piece a pawn becomes for each uci promotion letter
+_PROMOTION_PIECES = {'q': Queen, 'r': Rook, 'b': Bishop, 'n': Knight}
+# en-passant square strings, keyed by board index
+_EP_SQUARES = {(r, c): str((r, c)) for r in range(8) for c in range(8)}
+# thinking times (ms) the player vs AI opponent picks from each move
+_AI_THINK_TIMES = (2, 3, 4, 5)
+# castle rights lost when a piece moves from or to each king and rook home square
+_CASTLE_SQUARES = {(7, 4): 'KQ', (7, 7): 'K', (7, 0): 'Q', (0, 4): 'kq', (0, 7): 'k', (0, 0): 'q'}
+# half the opening angle of an arrow head
+_ARROW_HEAD_ANGLE = math.radians(30)
+# (ai_vs_ai, player_vs_ai) for each game mode
+_MODE_FLAGS = {'pvp': (False, False), 'aivai': (True, False), 'pvai': (False, True)}
+# end of game text for drawn outcomes reported by chess.Board.outcome()
+_DRAW_TEXT = {chess.Termination.STALEMATE: "DRAW BY STALEMATE",
+              chess.Termination.INSUFFICIENT_MATERIAL: "INSUFFICIENT MATERIAL"}
 
 
 def print_eval(evaluation):
@@ -35,6 +60,27 @@ def print_eval(evaluation):
             return 'Mate in ' + str(evaluation["value"])
 
 
+def save_pgn(game, path):
+    """
+    Write a game to a pgn file
+    :param game: chess.pgn.Game to save
+    :param path: path of the pgn file
+    :return: None
+    """
+    with open(path, "w") as file:
+        print(game, file=file, end="\n\n")
+
+
+def report_save_error(saved):
+    """
+    Print why a pgn file could not be written, as the write happens off the main thread
+    :param saved: finished future of save_pgn
+    :return: None
+    """
+    if saved.exception() is not None:
+        print("Could not save the game: " + str(saved.exception()))
+
+
 class Engine:
     def __init__(self):
         self.player_vs_ai = None
@@ -42,6 +88,9 @@ class Engine:
         self.evaluation = ''
         self.best_move = ''
         self.game_just_ended = False
+        self.end_game_menu = None
+        self.debug = False
+        self.pending_ai_move = None
         self.engine = 'stockfish'
         pg.init()
         pg.display.set_caption('Chess', 'chess')
@@ -52,6 +101,19 @@ class Engine:
         self.flipped = False
         self.flip_enabled = True
         self.sound_enabled = True
+        self.vsync_enabled = True
+        self.mode_size = None
+        self.sounds = {}
+        if pg.mixer.get_init():
+            try:
+                self.sounds = {name: pg.mixer.Sound('data/sounds/' + file_name) for name, file_name in
+                               (('move', 'move.mp3'), ('capture', 'capture.mp3'), ('castle', 'castle.mp3'),
+                                ('check', 'check.aiff'), ('mate', 'mate.wav'))}
+            except pg.error:
+                pass
+        # no audio device, play no sounds
+        if not self.sounds:
+            self.sound_enabled = False
         self.platform = None
         if 'Windows' in platform.platform():
             self.platform = 'Windows/' + self.engine + '.exe'
@@ -83,8 +145,20 @@ class Engine:
                 print(
                     "Stockfish program located in '" + "lit/" + self.engine + "/" + self.platform + "' is non respondent please install stockfish here: https://stockfishchess.org/download/")
                 sys.exit(0)
-        self.stockfish.set_fen_position("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+        # bound once, these are called for every move
+        self.stockfish_set_fen = self.stockfish.set_fen_position
+        self.stockfish_best_move_time = self.stockfish.get_best_move_time
+        self.stockfish_set_fen("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+        # positions are sent to stockfish on a worker thread so moves don't wait on the engine
+        self.engine_lock = threading.Lock()
+        self.engine_fen_queue = queue.Queue()
+        # error raised by the worker, re-raised by the next wait_for_engine()
+        self.engine_fen_error = None
+        threading.Thread(target=self.engine_fen_worker, daemon=True).start()
+        # finished games are written to disk in the background
+        self.io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         self.ai_strength = 0
+        self.applied_skill_level = None
 
         # self.engine_ = chess.engine.SimpleEngine.popen_uci('lit/stockfish/Windows/stockfish.exe')
         self.game = chess.pgn.Game()
@@ -105,15 +179,14 @@ class Engine:
         self.game.headers["Site"] = "UK"
         self.game.headers["WhiteElo"] = "?"
         self.game.headers["BlackElo"] = "?"
-        self.game.headers["Date"] = str(datetime.datetime.now().year) + '/' + str(
-            datetime.datetime.now().month) + '/' + str(datetime.datetime.now().day)
+        now = datetime.datetime.now()
+        self.game.headers["Date"] = f"{now.year}/{now.month}/{now.day}"
 
         self.piece_type = 'chessmonk'
         self.board_style = 'marble.png'
 
-        self.screen = pg.display.set_mode(
-            (pg.display.get_desktop_sizes()[0][1] - 70, pg.display.get_desktop_sizes()[0][1] - 70), pg.RESIZABLE,
-            vsync=1)
+        self.screen = self.set_display_mode(pg.display.get_desktop_sizes()[0][1] - 70,
+                                            pg.display.get_desktop_sizes()[0][1] - 70)
         self.settings = SettingsMenu(title='Settings', width=self.screen.get_width(), height=self.screen.get_height(),
                                      surface=self.screen, parent=self, theme=pm.themes.THEME_DARK)
         # "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
@@ -126,7 +199,8 @@ class Engine:
         self.white_pieces = pg.sprite.Group()
         self.all_pieces = pg.sprite.Group()
 
-        self.map = []
+        self.map = set()
+        self.legal_move_count = 0
         for i, row in enumerate(self.board):
             for j, piece in enumerate(row):
                 if piece != ' ':
@@ -139,13 +213,24 @@ class Engine:
         self.size = int((pg.display.get_window_size()[1] - 200) / 8)
         self.default_size = int(pg.display.get_window_size()[1] - 200 / 8)
         self.font = pg.font.SysFont('segoescript', 30)
+        self.text_surfaces = {}
         self.updates = False
         self.arrow_colour = (252, 177, 3)
+        self.arrow_surface = None
+        # (square size, corner offsets of each arrow head keyed by (angle, sign))
+        self.arrow_head_cache = (None, {})
         self.colours = [(118, 150, 86), (238, 238, 210)]
         # self.colours = [(50, 50, 50), (255, 255, 255)] 
         self.colours2 = [(150, 86, 86), (238, 215, 210)]
         self.colours3 = [(186, 202, 68), (255, 251, 171)]
         self.colours4 = [(252, 111, 76), (252, 137, 109)]
+        self.square_surfaces = {}
+        # (size, offset and flip the coordinates were built for, x of each column, y of each row)
+        self.square_coords_cache = (None, [], [])
+        # (board image, colours and square size, and the plain board drawn from them)
+        self.plain_board_cache = (None, None, None, None)
+        # (last move, square it was made from, square it was made to)
+        self.last_move_squares = (None, None, None)
         self.tx = None
         self.ty = None
         self.txr = None
@@ -161,8 +246,9 @@ class Engine:
                        pg.display.get_window_size()[1] / 2 - 4 * self.size]
         self.update_legal_moves()
         self.prev_board = self.board
-        self.debug = False
         self.node = self.game
+        # python-chess board kept in step with self.node, so it doesn't need replaying from the root every move
+        self.chess_board = chess.Board()
         self.show_numbers = True
         self.knight_moves = [(1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)]
         if EVAL_ON:
@@ -225,9 +311,11 @@ class Engine:
                 if event.key == pg.K_r and pg.key.get_mods() & pg.KMOD_CTRL:
                     self.flip_board()
                 if event.key == pg.K_h and pg.key.get_mods() & pg.KMOD_CTRL:
-                    self.stockfish.set_skill_level(20)
-                    self.best_move = str(self.stockfish.get_best_move_time(200))
-                    self.stockfish.set_skill_level(self.ai_strength)
+                    self.wait_for_engine()
+                    with self.engine_lock:
+                        self.apply_skill_level(20)
+                        self.best_move = str(self.stockfish_best_move_time(200))
+                        self.apply_skill_level(self.ai_strength)
                 if event.key == pg.K_u:
                     if len(self.game_fens) > 1:
                         self.undo_move(False)
@@ -239,7 +327,7 @@ class Engine:
                     self.settings.run()
             elif event.type == pg.VIDEORESIZE:
                 # There's some code to add back window content here.
-                self.screen = pg.display.set_mode((event.w, event.h), pg.RESIZABLE, vsync=1)
+                self.screen = self.set_display_mode(event.w, event.h)
                 self.settings.resize_event()
                 self.background = pg.image.load('data/img/background_dark.png').convert()
                 self.background = pg.transform.smoothscale(self.background,
@@ -271,6 +359,12 @@ class Engine:
 
         if self.ai_vs_ai:
             self.un_click_left()
+        if self.pending_ai_move is not None and time.monotonic() >= self.pending_ai_move[0]:
+            _, y, row, col = self.pending_ai_move
+            self.pending_ai_move = None
+            self.ai_make_move(y, row, col)
+            if EVAL_ON:
+                self.get_eval()
         pg.display.flip()
         self.clock.tick(150)
 
@@ -279,11 +373,50 @@ class Engine:
         Get board evaluation
         :return: Evaluation string
         """
-        self.stockfish.set_depth(20)
-        evaluation = print_eval(self.stockfish.get_evaluation())
-        self.stockfish.set_depth(99)
+        self.wait_for_engine()
+        with self.engine_lock:
+            self.stockfish.set_depth(20)
+            evaluation = print_eval(self.stockfish.get_evaluation())
+            self.stockfish.set_depth(99)
         return evaluation
 
+    def engine_fen_worker(self) -> None:
+        """
+        Worker thread that sends queued positions to stockfish. Only the latest queued position is sent.
+        Queue items are (fen, new_game) tuples; "ucinewgame" is only sent when a new game starts, so stockfish keeps
+        its hash table between moves of the same game.
+        :return: None
+        """
+        while True:
+            fen, new_game = self.engine_fen_queue.get()
+            # take everything queued since in one go
+            with self.engine_fen_queue.mutex:
+                queued = list(self.engine_fen_queue.queue)
+                self.engine_fen_queue.queue.clear()
+            # only the newest position matters, but a new game anywhere in the batch still needs ucinewgame
+            if queued:
+                fen = queued[-1][0]
+                new_game = new_game or any(queued_new_game for _, queued_new_game in queued)
+            try:
+                with self.engine_lock:
+                    self.stockfish_set_fen(fen, new_game)
+            except Exception as error:
+                # keep the worker alive and hand the error to whoever waits on the queue next
+                self.engine_fen_error = error
+            finally:
+                for _ in range(len(queued) + 1):
+                    self.engine_fen_queue.task_done()
+
+    def wait_for_engine(self) -> None:
+        """
+        Wait until every queued position has been sent to stockfish, re-raising any error the worker hit
+        :return: None
+        """
+        self.engine_fen_queue.join()
+        error, self.engine_fen_error = self.engine_fen_error, None
+        if error is not None:
+            raise error
+
     def un_click_left(self) -> None:
         """
         Left click release event logic. Calls make_move which makes a move if it is legal
@@ -292,9 +425,7 @@ class Engine:
         self.highlighted.clear()
         self.arrows.clear()
         if self.ai_vs_ai:
-            self.ai_make_move(0, 0, 0)
-            if EVAL_ON:
-                self.get_eval()
+            self.schedule_ai_move(0, 0, 0)
         else:
             for piece in self.all_pieces:
                 row = piece.position[0]
@@ -302,10 +433,10 @@ class Engine:
                 if self.board[row][col] != ' ':
                     if self.board[row][col].clicked:
                         # Make move if legal
-                        if self.board[row][col].make_move(self.board, self.offset, self.turn, self.flipped, None,
-                                                          None):
-                            x = int((pg.mouse.get_pos()[0] - self.offset[0]) // self.size)
-                            y = int((pg.mouse.get_pos()[1] - self.offset[1]) // self.size)
+                        # no player moves while the engine's reply is pending
+                        if self.pending_ai_move is None and self.board[row][col].make_move(
+                                self.board, self.offset, self.turn, self.flipped, None, None):
+                            x, y = self.mouse_square()
                             if self.flipped:
                                 x = -x + 7
                                 y = -y + 7
@@ -319,7 +450,7 @@ class Engine:
 
                                 # add move to chess.pgn node
                                 self.last_move.append(move)
-                                self.node = self.node.add_variation(chess.Move.from_uci(move))
+                                self.record_move(move)
                             elif self.turn == 'b':
                                 self.fullmove_number += 1
                                 self.turn = 'w'
@@ -332,17 +463,15 @@ class Engine:
 
                                     # add move to chess.pgn node
                                     self.last_move.append(move)
-                                    self.node = self.node.add_variation(chess.Move.from_uci(move))
+                                    self.record_move(move)
 
-                            self.moved()
+                            self.moved(row, col)
                             if self.board[y][x] != ' ':
                                 self.board[y][x].clicked = False
                             if EVAL_ON:
                                 self.get_eval()
                             if self.player_vs_ai:
-                                self.ai_make_move(y, row, col)
-                                if EVAL_ON:
-                                    self.get_eval()
+                                self.schedule_ai_move(y, row, col)
                         else:
                             self.board[row][col].clicked = False
                         break
@@ -368,12 +497,24 @@ class Engine:
         self.board_background = pg.transform.smoothscale(self.board_background,
                                                          (self.size * 8, self.size * 8))
 
+    def set_display_mode(self, width: int, height: int) -> pg.Surface:
+        """
+        Create the display surface and remember its size, so it is only recreated when the size changes
+        :param width: width of the window
+        :param height: height of the window
+        :return: The display surface
+        """
+        self.mode_size = (width, height)
+        return pg.display.set_mode((width, height), pg.RESIZABLE, vsync=int(self.vsync_enabled))
+
     def check_resize(self):
         """
         Checks if the window has been resized and handles resizing
         :return: None
         """
-        self.screen = pg.display.set_mode((self.screen.get_width(), self.screen.get_height()), pg.RESIZABLE, vsync=1)
+        if (self.screen.get_width(), self.screen.get_height()) == self.mode_size:
+            return
+        self.screen = self.set_display_mode(self.screen.get_width(), self.screen.get_height())
         self.background = pg.image.load('data/img/background_dark.png').convert()
         self.background = pg.transform.smoothscale(self.background,
                                                    (pg.display.get_window_size()[0], pg.display.get_window_size()[1]))
@@ -406,15 +547,21 @@ class Engine:
         :param mode: String of the mode: 'pvp', 'pvai', or 'aivai'
         :return: None
         """
-        if mode == 'pvp':
-            self.ai_vs_ai = False
-            self.player_vs_ai = False
-        elif mode == 'aivai':
-            self.ai_vs_ai = True
-            self.player_vs_ai = False
-        elif mode == 'pvai':
-            self.ai_vs_ai = False
-            self.player_vs_ai = True
+        flags = _MODE_FLAGS.get(mode)
+        if flags is None:
+            return
+        self.ai_vs_ai, self.player_vs_ai = flags
+
+    def schedule_ai_move(self, y: int, row: int, col: int) -> None:
+        """
+        Queue an engine move, played by run() after a short delay instead of sleeping on the main thread
+        :param y: the moves column number; For promotion logic
+        :param row: Row position of the piece to move
+        :param col: Column position of the piece to move
+        :return: None
+        """
+        if self.pending_ai_move is None:
+            self.pending_ai_move = (time.monotonic() + AI_MOVE_DELAY, y, row, col)
 
     def ai_make_move(self, y: int, row: int, col: int):
         """
@@ -424,24 +571,30 @@ class Engine:
         :return: None
         """
         # Engine Moves
-        self.draw_board()
-        self.draw_pieces()
-        pg.display.flip()
-        time.sleep(0.15)
         move = self.move_strength(self.ai_strength)
         if move is not None:
             self.last_move.append(move)
             if self.board[row][col] != ' ':
                 if self.board[row][col].piece == 'p':  # auto promote queen
-                    if y == 7 or y == 0:
+                    if (y == 7 or y == 0) and len(move) == 4:
                         move += 'q'
-            self.node = self.node.add_variation(chess.Move.from_uci(move))
+            self.record_move(move)
             self.engine_make_move(move)  # Making the move
         else:
             print('Fault')
             self.end_game('Fault')
             self.reset_game()
 
+    def record_move(self, move: str) -> None:
+        """
+        Add a move to the pgn game tree and the python-chess board
+        :param move: Move in uci notation. e.g. "a2a4" or "e7e8q"
+        :return: None
+        """
+        chess_move = chess.Move.from_uci(move)
+        self.node = self.node.add_variation(chess_move)
+        self.chess_board.push(chess_move)
+
     def move_strength(self, strength: int) -> str | None:
         """
         Get the best move given the strength input
@@ -450,15 +603,12 @@ class Engine:
         """
         # return moves[0]["Move"]
         if self.ai_vs_ai:
-            if self.turn == 'w':
-                # self.stockfish.set_skill_level(20)
-                a = 15 * (strength + 1)
-            else:
-                # self.stockfish.set_skill_level(1)
-                a = 15 * (strength + 1)
+            a = 15 * (strength + 1)
         else:
-            a = random.randint(2, 5)
-        move = self.stockfish.get_best_move_time(a)
+            a = random.choice(_AI_THINK_TIMES)
+        self.wait_for_engine()
+        with self.engine_lock:
+            move = self.stockfish_best_move_time(a)
         return move
 
     def change_ai_strength(self, num: int) -> None:
@@ -468,7 +618,19 @@ class Engine:
         :return: None
         """
         self.ai_strength = num
-        self.stockfish.set_skill_level(num)
+        with self.engine_lock:
+            self.apply_skill_level(num)
+
+    def apply_skill_level(self, level: int) -> None:
+        """
+        Send the skill level to stockfish, unless it is already set. Call with engine_lock held.
+        :param level: skill level from 0-20
+        :return: None
+        """
+        if level == self.applied_skill_level:
+            return
+        self.stockfish.set_skill_level(level)
+        self.applied_skill_level = level
 
     def un_click_right(self, left_click: bool) -> None:
         """
@@ -476,8 +638,7 @@ class Engine:
         :param left_click: is currently clicking left?
         :return: None
         """
-        txr = int((pg.mouse.get_pos()[0] - self.offset[0]) // self.size)
-        tyr = int((pg.mouse.get_pos()[1] - self.offset[1]) // self.size)
+        txr, tyr = self.mouse_square()
         if self.flipped:
             txr = 7 - txr
             tyr = 7 - tyr
@@ -507,134 +668,125 @@ class Engine:
             pieces.clicked = False
         self.left = False
 
-    def moved(self) -> None:
+    def moved(self, src_row: int, src_col: int, promotion_type: str = 'q') -> None:
         """
         Called after make_move to update legal moves,
         check for the end of game, and play sounds
+        :param src_row: Row the moved piece came from
+        :param src_col: Column the moved piece came from
+        :param promotion_type: uci letter of the piece a pawn promotes to
         :return: None
         """
         self.prev_board = self.board
         eps_moved_made = False
-        for i, row in enumerate(self.board):
-            for j, piece in enumerate(row):
-                if piece != ' ':
-                    if piece.position != (i, j):
-                        # piece no longer on the square of the board
-                        self.board[i][j] = ' '
-
-                        # has a pawn moved 2 squares. en-passant check
-                        if piece.piece.lower() == 'p' and piece.position[0] - i == 2 * piece.direction:
-                            self.en_passant_square = str(
-                                (piece.position[0] + int((piece.position[0] - i) / 2), piece.position[1]))
-                        else:
-                            self.en_passant_square = '-'
-
-                        # has a pawn been captured with enpassant
-                        if piece.piece.lower() == 'p':
-                            if piece.position[0] - i == piece.direction and (
-                                    piece.position[1] - j == 1 or piece.position[1] - j == -1):
-                                if self.board[piece.position[0]][piece.position[1]] == ' ':
-                                    eps_moved_made = True
-                                    self.board[piece.position[0] - piece.direction][piece.position[1]].dead = True
-                                    self.board[piece.position[0] - piece.direction][piece.position[1]] = ' '
-
-                        # king has castled
-                        castle = False
-                        if piece.piece.lower() == 'k':
-                            if piece.position[1] - j == 2 or piece.position[1] - j == -2:
-                                castle = True
-                                if piece.position[1] < 4:
-                                    self.board[piece.position[0]][3] = self.board[piece.position[0]][0]
-                                    self.board[piece.position[0]][0] = ' '
-                                    self.board[piece.position[0]][3].position = (piece.position[0], 3)
-                                else:
-                                    self.board[piece.position[0]][5] = self.board[piece.position[0]][7]
-                                    self.board[piece.position[0]][7] = ' '
-                                    self.board[piece.position[0]][5].position = (piece.position[0], 5)
-
-                        piece_sound = self.board[piece.position[0]][piece.position[1]]
-
-                        # update the board
-                        if self.board[piece.position[0]][piece.position[1]] != ' ':
-                            self.board[piece.position[0]][piece.position[1]].dead = True
-                        self.board[piece.position[0]][piece.position[1]] = piece
-
-                        # promotion
-                        promote = False
-                        if piece.piece.lower() == 'p':
-                            if piece.position[0] == int(3.5 + piece.direction * 3.5):
-                                self.promotion(piece)
-                                promote = True
-
-                        if (castle or promote) and self.sound_enabled:
-                            pg.mixer.music.load('data/sounds/castle.mp3')
-                            pg.mixer.music.play(1)
-                        elif piece_sound == ' ' and not eps_moved_made and self.sound_enabled:
-                            pg.mixer.music.load('data/sounds/move.mp3')
-                            pg.mixer.music.play(1)
-                        elif self.sound_enabled:
-                            pg.mixer.music.load('data/sounds/capture.mp3')
-                            pg.mixer.music.play(1)
-
-                        break
-        for p in self.all_pieces:
-            if p.dead:
-                self.all_pieces.remove(p)
-        for p in self.black_pieces:
-            if p.dead:
-                self.black_pieces.remove(p)
-        for p in self.white_pieces:
-            if p.dead:
-                self.white_pieces.remove(p)
+        i, j = src_row, src_col
+        piece = self.board[i][j]
+        if self.debug:
+            for r, row in enumerate(self.board):
+                for c, p in enumerate(row):
+                    assert p == ' ' or p.position == (r, c) or (r, c) == (i, j)
+
+        # piece no longer on the square of the board
+        self.board[i][j] = ' '
+
+        # moving a king or rook, or capturing a rook, gives up castle rights
+        if self.castle_rights != '-':
+            lost = _CASTLE_SQUARES.get((i, j), '') + _CASTLE_SQUARES.get(piece.position, '')
+            if lost:
+                self.castle_rights = ''.join(flag for flag in self.castle_rights if flag not in lost) or '-'
+
+        # has a pawn moved 2 squares. en-passant check
+        if piece.is_pawn and piece.position[0] - i == 2 * piece.direction:
+            self.en_passant_square = _EP_SQUARES[(piece.position[0] + piece.direction,
+                                                  piece.position[1])]
+        else:
+            self.en_passant_square = '-'
+
+        # has a pawn been captured with enpassant
+        if piece.is_pawn:
+            if piece.position[0] - i == piece.direction and (
+                    piece.position[1] - j == 1 or piece.position[1] - j == -1):
+                if self.board[piece.position[0]][piece.position[1]] == ' ':
+                    eps_moved_made = True
+                    self.capture(self.board[piece.position[0] - piece.direction][piece.position[1]])
+                    self.board[piece.position[0] - piece.direction][piece.position[1]] = ' '
+
+        # king has castled
+        castle = False
+        if piece.is_king:
+            if piece.position[1] - j == 2 or piece.position[1] - j == -2:
+                castle = True
+                if piece.position[1] < 4:
+                    self.board[piece.position[0]][3] = self.board[piece.position[0]][0]
+                    self.board[piece.position[0]][0] = ' '
+                    self.board[piece.position[0]][3].position = (piece.position[0], 3)
+                else:
+                    self.board[piece.position[0]][5] = self.board[piece.position[0]][7]
+                    self.board[piece.position[0]][7] = ' '
+                    self.board[piece.position[0]][5].position = (piece.position[0], 5)
+
+        piece_sound = self.board[piece.position[0]][piece.position[1]]
+
+        # update the board
+        if self.board[piece.position[0]][piece.position[1]] != ' ':
+            self.capture(self.board[piece.position[0]][piece.position[1]])
+        self.board[piece.position[0]][piece.position[1]] = piece
+
+        # promotion
+        promote = False
+        if piece.is_pawn:
+            if piece.position[0] == _PROMOTION_ROW[piece.direction]:
+                self.promotion(piece, promotion_type)
+                promote = True
+
+        if (castle or promote) and self.sound_enabled:
+            self.sounds['castle'].play()
+        elif piece_sound == ' ' and not eps_moved_made and self.sound_enabled:
+            self.sounds['move'].play()
+        elif self.sound_enabled:
+            self.sounds['capture'].play()
 
         # update next players legal moves
         if self.update_legal_moves() and self.sound_enabled:
-            pg.mixer.music.load('data/sounds/check.aiff')
-            pg.mixer.music.play(1)
+            self.sounds['check'].play()
 
         legal_moves = self.count_legal_moves()
         # print('Number of legal moves', legal_moves)
         # print FEN notation of position
         self.game_fens.append(
             create_FEN(self.board, self.turn, self.castle_rights, self.en_passant_square, self.fullmove_number))
-        self.stockfish.set_fen_position(self.game_fens[-1])
+        self.engine_fen_queue.put((self.game_fens[-1], False))
         # print(self.game_fens[-1])
         if not self.player_vs_ai and not self.ai_vs_ai and self.flip_enabled:
             self.flip_board()
 
-        if self.node.board().is_repetition():
-            if self.sound_enabled:
-                pg.mixer.music.load('data/sounds/mate.wav')
-                pg.mixer.music.play(1)
-                time.sleep(0.15)
-                pg.mixer.music.play(1)
-            self.end_game("DRAW BY REPETITION")
-        elif self.node.board().is_stalemate():
-            if self.sound_enabled:
-                pg.mixer.music.load('data/sounds/mate.wav')
-                pg.mixer.music.play(1)
-                time.sleep(0.15)
-                pg.mixer.music.play(1)
-            self.end_game("INSUFFICIENT MATERIAL")
-        elif self.node.board().is_insufficient_material():
-            if self.sound_enabled:
-                pg.mixer.music.load('data/sounds/mate.wav')
-                pg.mixer.music.play(1)
-                time.sleep(0.15)
-                pg.mixer.music.play(1)
-            self.end_game("INSUFFICIENT MATERIAL")
-        elif self.node.board().is_checkmate() or legal_moves == 0:
-            if self.sound_enabled:
-                pg.mixer.music.load('data/sounds/mate.wav')
-                pg.mixer.music.play(1)
-                time.sleep(0.15)
-                pg.mixer.music.play(1)
-            if self.node.board().outcome().winner:
-                self.end_game("CHECKMATE WHITE WINS !!")
+        # one outcome check instead of one per end condition
+        board = self.chess_board
+        outcome = board.outcome()
+        end_text = None
+        if board.is_repetition():
+            end_text = "DRAW BY REPETITION"
+        elif outcome is not None and outcome.termination in _DRAW_TEXT:
+            end_text = _DRAW_TEXT[outcome.termination]
+        elif (outcome is not None and outcome.termination == chess.Termination.CHECKMATE) or legal_moves == 0:
+            if outcome is not None and outcome.winner:
+                end_text = "CHECKMATE WHITE WINS !!"
             else:
-                self.end_game("CHECKMATE BLACK WINS !!")
+                end_text = "CHECKMATE BLACK WINS !!"
+        if end_text is not None:
+            if self.sound_enabled:
+                self.sounds['mate'].play(loops=1)
+            self.end_game(end_text)
         # pprint(self.board, indent=3)
 
+    def capture(self, piece: Piece) -> None:
+        """
+        Remove a captured piece from the piece groups
+        :param piece: The captured piece
+        :return: None
+        """
+        piece.kill()
+
     def end_game(self, end_text: str) -> None:
         """
         Called when the game has ended. Saves the game in 'data/games/' and displays the end game menu
@@ -644,16 +796,15 @@ class Engine:
         self.game_just_ended = True
         dt = datetime.datetime.now()
         dt = dt.strftime("%Y%m%d_%H%M%S_%f")
-        print(self.game, file=open("data/games/" + dt + ".pgn", "w"), end="\n\n")
-        game_str = str(self.game)
-        time.sleep(1)
+        saved = self.io_pool.submit(save_pgn, self.game, "data/games/" + dt + ".pgn")
+        saved.add_done_callback(report_save_error)
         self.reset_game()
 
         # End game screen
         self.end_game_menu = EndGameMenu(title='Game Over', width=self.screen.get_width(),
                                          height=self.screen.get_height(),
                                          surface=self.screen, parent=self, theme=pm.themes.THEME_DARK)
-        self.end_game_menu.set_file_path_and_text("data/games/" + dt + ".pgn", end_text)
+        self.end_game_menu.set_file_path_and_text("data/games/" + dt + ".pgn", end_text, saved)
         self.end_game_menu.run()
 
     def reset_game(self) -> None:
@@ -662,35 +813,30 @@ class Engine:
         :return: None
         """
         self.updates_kill()
+        self.pending_ai_move = None
         self.board, self.turn, self.castle_rights, self.en_passant_square, self.halfmoves_since_last_capture, self.fullmove_number = parse_FEN(
             self.game_fens[0])
-        self.game_fens = [self.game_fens[0]]
-        for p in self.all_pieces:
-            self.all_pieces.remove(p)
-        for p in self.black_pieces:
-            self.black_pieces.remove(p)
-        for p in self.white_pieces:
-            self.white_pieces.remove(p)
-        for i, row in enumerate(self.board):
-            for j, piece in enumerate(row):
-                try:
-                    if piece != ' ':
-                        self.all_pieces.add(piece)
-                        if piece.colour == 'black':
-                            self.black_pieces.add(piece)
-                        else:
-                            self.white_pieces.add(piece)
-                except:
-                    pass
+        del self.game_fens[1:]
+        self.all_pieces.empty()
+        self.black_pieces.empty()
+        self.white_pieces.empty()
+        for row in self.board:
+            for piece in row:
+                if piece != ' ':
+                    self.all_pieces.add(piece)
+                    if piece.colour == 'black':
+                        self.black_pieces.add(piece)
+                    else:
+                        self.white_pieces.add(piece)
         for piece in self.all_pieces:
             piece.change_piece_set(self.piece_type)
             piece.clicked = False
-        self.last_move = []
+        self.last_move.clear()
         self.game = chess.pgn.Game()
         self.game.headers["Event"] = "Player Vs Computer"
         self.game.headers["Site"] = "UK"
-        self.game.headers["Date"] = str(datetime.datetime.now().year) + '/' + str(
-            datetime.datetime.now().month) + '/' + str(datetime.datetime.now().day)
+        now = datetime.datetime.now()
+        self.game.headers["Date"] = f"{now.year}/{now.month}/{now.day}"
         if self.ai_vs_ai:
             self.game.headers["Event"] = "Computer Vs Computer"
             self.game.headers["Black"] = "Computer"
@@ -707,7 +853,8 @@ class Engine:
         self.game.headers["WhiteElo"] = "?"
         self.game.headers["BlackElo"] = "?"
         self.node = self.game
-        self.stockfish.set_fen_position(self.game_fens[0])
+        self.chess_board.reset()
+        self.engine_fen_queue.put((self.game_fens[0], True))
         self.update_legal_moves()
 
     def undo_move(self, one: bool) -> None:
@@ -716,6 +863,7 @@ class Engine:
         :param one: Is the length of the game ONLY ONE move?
         :return: None
         """
+        self.pending_ai_move = None
         if len(self.last_move) > 0:
             if one:
                 self.board, self.turn, self.castle_rights, self.en_passant_square, self.halfmoves_since_last_capture, self.fullmove_number = parse_FEN(
@@ -724,27 +872,20 @@ class Engine:
                 self.game_fens.pop()
                 self.board, self.turn, self.castle_rights, self.en_passant_square, self.halfmoves_since_last_capture, self.fullmove_number = parse_FEN(
                     self.game_fens[-1])
-            for p in self.all_pieces:
-                self.all_pieces.remove(p)
-            for p in self.black_pieces:
-                self.black_pieces.remove(p)
-            for p in self.white_pieces:
-                self.white_pieces.remove(p)
-            for i, row in enumerate(self.board):
-                for j, piece in enumerate(row):
-                    try:
-                        if piece != ' ':
-                            self.all_pieces.add(piece)
-                            if piece.colour == 'black':
-                                self.black_pieces.add(piece)
-                            else:
-                                self.white_pieces.add(piece)
-                    except:
-                        pass
+            # the undone position is all new pieces, so swap the groups' contents wholesale
+            pieces = [piece for row in self.board for piece in row if piece != ' ']
+            self.all_pieces.empty()
+            self.black_pieces.empty()
+            self.white_pieces.empty()
+            self.all_pieces.add(pieces)
+            self.black_pieces.add([piece for piece in pieces if piece.colour == 'black'])
+            self.white_pieces.add([piece for piece in pieces if piece.colour == 'white'])
             for piece in self.all_pieces:
                 piece.change_piece_set(self.piece_type)
             self.last_move.pop()
             self.node = self.node.parent  # allows for undoes to show in analysis on https://chess.com/analysis
+            if self.chess_board.move_stack:
+                self.chess_board.pop()
             if not self.player_vs_ai and not self.ai_vs_ai and self.flip_enabled:
                 self.flip_board()
 
@@ -756,22 +897,21 @@ class Engine:
         Update the all legal moves
         :return: True if in check, false if not in check
         """
-        castle = []
         in_check = False
+        checkers = []
+        turn_colour = 'white' if self.turn == 'w' else 'black'
         for piece in self.all_pieces:
-            if piece.piece.lower() == 'k':
-                if not piece.has_moved:
-                    castle.append(piece.colour)
-            if piece.colour[0] == self.turn:
+            if piece.colour == turn_colour:
                 piece.update_legal_moves(self.board, self.en_passant_square, captures=False)
             else:
-                if piece.piece.lower() in ['b', 'r', 'q', 'n', 'p']:
+                if not piece.is_king:
                     if piece.check(self.board):
                         in_check = True
-                if piece.piece.lower() in ['b', 'r', 'q']:
+                        checkers.append(piece)
+                if piece.is_slider:
                     piece.pin_line_update(self.board)
-
-        self.handle_fen_castle(castle)
+        # checking pieces in board order, as trim_checks would find them scanning the board
+        checkers.sort(key=lambda checker: checker.position)
 
         if self.turn == 'w':
             self.map = self.create_map(self.black_pieces)
@@ -781,19 +921,22 @@ class Engine:
         # if in_check:
         if self.turn == 'w':
             for piece in self.white_pieces:
-                piece.trim_checks(self.board, self.turn, self.map, in_check)
+                piece.trim_checks(self.board, self.turn, self.map, in_check, checkers)
         else:
             for piece in self.black_pieces:
-                piece.trim_checks(self.board, self.turn, self.map, in_check)
+                piece.trim_checks(self.board, self.turn, self.map, in_check, checkers)
 
         if self.turn == 'w':
             for piece in self.black_pieces:
-                if piece.piece.lower() in ['b', 'r', 'q']:
+                if piece.is_slider:
                     piece.trim_pin_moves(self.board)
         else:
             for piece in self.white_pieces:
-                if piece.piece.lower() in ['b', 'r', 'q']:
+                if piece.is_slider:
                     piece.trim_pin_moves(self.board)
+
+        turn_pieces = self.white_pieces if self.turn == 'w' else self.black_pieces
+        self.legal_move_count = sum(len(piece.legal_positions) for piece in turn_pieces)
         return in_check
 
     def make_move_board(self, move: tuple, piece: Piece) -> None:
@@ -803,15 +946,15 @@ class Engine:
         :param piece: The piece that is moving
         :return: None
         """
-        if self.board[piece.position[0]][piece.position[1]].make_move(self.board, self.offset, self.turn, self.flipped,
-                                                                      piece.position[1] + move[0],
-                                                                      piece.position[0] + move[1]):
+        src_row, src_col = piece.position
+        if self.board[src_row][src_col].make_move(self.board, self.offset, self.turn, self.flipped,
+                                                  src_col + move[0], src_row + move[1]):
             if self.turn == 'w':
                 self.turn = 'b'
             else:
                 self.fullmove_number += 1
                 self.turn = 'w'
-            self.moved()
+            self.moved(src_row, src_col)
             self.board[piece.position[0]][piece.position[1]].clicked = False
 
     def engine_make_move(self, move: str) -> None:
@@ -833,117 +976,61 @@ class Engine:
                 else:
                     self.fullmove_number += 1
                     self.turn = 'w'
-                self.moved()
+                self.moved(square1[0], square1[1], move[4:] or 'q')
                 self.board[piece.position[0]][piece.position[1]].clicked = False
 
         except:
             pass
 
-    def create_map(self, pieces: list[Piece]) -> list[tuple]:
+    def create_map(self, pieces: list[Piece]) -> set[tuple]:
         """
-        Returns a list of squares the pieces attack
+        Returns the set of squares the pieces attack
         :param pieces: list of pieces to check attacking squares
-        :return: list of the attacked squares
+        :return: set of the attacked squares
         """
         map = set()
         for piece in pieces:
             piece.update_legal_moves(self.board, '-', captures=True)
-            for move in piece.legal_positions:
-                map.add((piece.position[0] + move[1], piece.position[1] + move[0]))
-        return list(map)
+            row, col = piece.position
+            map.update([(row + dy, col + dx) for dx, dy in piece.legal_positions])
+        return map
 
     def count_legal_moves(self) -> int:
         """
-        Get the number of legal moves
+        Get the number of legal moves, as counted by the last update_legal_moves()
         :return: Number of legal moves
         """
-        count = 0
-        for i, row in enumerate(self.board):
-            for j, piece in enumerate(row):
-                if piece != ' ':
-                    if piece.colour[0] == self.turn:
-                        count += len(piece.legal_positions)
-        return count
+        return self.legal_move_count
 
-    def promotion(self, piece: Piece) -> None:
+    def promotion(self, piece: Piece, promotion_type: str = 'q') -> None:
         """
-        Promote the given piece to a queen
+        Promote the given piece
         :param piece: A piece to promote
+        :param promotion_type: uci letter of the new piece, 'q', 'r', 'b' or 'n'. Defaults to a queen
         :return: None
         """
-        self.all_pieces.remove(piece)
-        self.board[piece.position[0]][piece.position[1]] = Queen(position=(piece.position[0], piece.position[1]),
-                                                                 colour=piece.colour, piece_type=self.piece_type)
-        self.all_pieces.add(self.board[piece.position[0]][piece.position[1]])
-        if piece.colour == 'black':
-            self.black_pieces.remove(piece)
-            self.black_pieces.add(self.board[piece.position[0]][piece.position[1]])
-        else:
-            self.white_pieces.remove(piece)
-            self.white_pieces.add(self.board[piece.position[0]][piece.position[1]])
-
-    def handle_fen_castle(self, castle: list[str]) -> None:
-        """
-        Update castle rights
-        :param castle: either ["black", "white"], ["black"], or ["white"]
-        :return: None
-        """
-        if 'black' in castle and 'white' in castle:
-            self.castle_rights = 'KQkq'
-        elif 'black' in castle:
-            self.castle_rights = 'kq'
-        elif 'white' in castle:
-            self.castle_rights = 'KQ'
+        row, col = piece.position
+        piece_class = _PROMOTION_PIECES.get(promotion_type, Queen)
+        if piece_class is Queen:
+            new_piece = Queen(position=(row, col), colour=piece.colour, piece_type=self.piece_type)
         else:
-            self.castle_rights = '-'
-
-        try:
-            if self.board[0][0] == ' ' and 'q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('q', '')
-            elif self.board[0][0].piece != 'r' and 'q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('q', '')
-            elif self.board[0][0].piece == 'r' and self.board[0][0].has_moved and 'q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('q', '')
-        except:
-            pass
-        try:
-            if self.board[0][7] == ' ' and 'k' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('k', '')
-            elif self.board[0][7].piece != 'r' and 'k' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('k', '')
-            elif self.board[0][7].piece == 'r' and self.board[0][7].has_moved and 'k' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('k', '')
-        except:
-            pass
-        try:
-            if self.board[7][0] == ' ' and 'Q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('Q', '')
-            elif self.board[7][0].piece != 'R' and 'Q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('Q', '')
-            elif self.board[7][0].piece == 'R' and self.board[7][0].has_moved and 'Q' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('Q', '')
-        except:
-            pass
-        try:
-            if self.board[7][7] == ' ' and 'K' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('K', '')
-            elif self.board[7][7].piece != 'R' and 'K' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('K', '')
-            elif self.board[7][7].piece == 'R' and self.board[7][7].has_moved and 'K' in self.castle_rights:
-                self.castle_rights = self.castle_rights.replace('K', '')
-        except:
-            pass
-
-        if self.castle_rights == '':
-            self.castle_rights = '-'
+            new_piece = piece_class(position=(row, col), colour=piece.colour)
+            new_piece.change_piece_set(self.piece_type)
+            # a promoted rook can never be castled with
+            new_piece.has_moved = True
+        self.board[row][col] = new_piece
+        pieces = self.black_pieces if piece.colour == 'black' else self.white_pieces
+        pieces.remove(piece)
+        pieces.add(new_piece)
+        self.all_pieces.remove(piece)
+        self.all_pieces.add(new_piece)
 
     def click_right(self) -> None:
         """
         handle Right click event. Stores the co-ordinates of the click. Used for highlighting and arrows
         :return: None
         """
-        self.txr = int((pg.mouse.get_pos()[0] - self.offset[0]) // self.size)
-        self.tyr = int((pg.mouse.get_pos()[1] - self.offset[1]) // self.size)
+        self.txr, self.tyr = self.mouse_square()
         if self.flipped:
             self.txr = 7 - self.txr
             self.tyr = 7 - self.tyr
@@ -953,112 +1040,148 @@ class Engine:
         Handle left click event. Stores co-ordinates of mouse and sets updates to true to enable drawing of clicked piece.
         :return: None
         """
-        self.tx = int((pg.mouse.get_pos()[0] - self.offset[0]) // self.size)
-        self.ty = int((pg.mouse.get_pos()[1] - self.offset[1]) // self.size)
+        self.tx, self.ty = self.mouse_square()
         self.updates = True
 
+    def mouse_square(self) -> tuple[int, int]:
+        """
+        Square under the mouse as drawn on screen, before undoing any board flip
+        :return: column and row of the square
+        """
+        mouse_x, mouse_y = pg.mouse.get_pos()
+        return int((mouse_x - self.offset[0]) // self.size), int((mouse_y - self.offset[1]) // self.size)
+
     def update_board(self) -> None:
         """
         If currently clicking a piece then update the pieces positions and show the legal moves
         :return: None
         """
-        try:
-            if not self.flipped:
-                if -1 < self.tx < 8 and -1 < self.ty < 8:
-                    if self.board[self.ty][self.tx] != ' ':
-                        self.board[self.ty][self.tx].clicked = True
-                        self.board[self.ty][self.tx].show_legal_moves(self.screen, self.offset, self.turn, self.flipped,
-                                                                      self.board)
-            else:
-                if -1 < self.tx < 8 and -1 < self.ty < 8:
-                    if self.board[-self.ty + 7][-self.tx + 7] != ' ':
-                        self.board[-self.ty + 7][-self.tx + 7].clicked = True
-                        self.board[-self.ty + 7][-self.tx + 7].show_legal_moves(self.screen, self.offset, self.turn,
-                                                                                self.flipped, self.board)
-        except:
-            pass
+        tx, ty = self.tx, self.ty
+        if tx is None or not (-1 < tx < 8 and -1 < ty < 8):
+            return
+        if self.flipped:
+            tx, ty = 7 - tx, 7 - ty
+        piece = self.board[ty][tx]
+        if piece != ' ':
+            piece.clicked = True
+            piece.show_legal_moves(self.screen, self.offset, self.turn, self.flipped, self.board)
 
     def draw_board(self) -> None:
         """
         Draw the board, with highlighted squares and last moves. Draw numbers on the sides of the board.
         :return: None
         """
-        self.screen.blit(self.background, (0, 0))
-        self.screen.blit(self.board_background, (self.offset[0], self.offset[1]))
-        square1 = None
-        square2 = None
-        if len(self.last_move) > 1:
-            square1 = square_on(self.last_move[-1][0:2])
-            square2 = square_on(self.last_move[-1][2:4])
-        elif len(self.last_move) == 1:
-            square1 = square_on(self.last_move[0][0:2])
-            square2 = square_on(self.last_move[0][2:4])
-        count = 1
-        for row in range(8):
-            for col in range(8):
-                if self.flipped:
-                    row_new = -row + 7
-                    col_new = -col + 7
-                else:
-                    row_new = row
-                    col_new = col
-                surface = pg.Surface((self.size, self.size))
-                surface.set_alpha(200)
-                if self.debug and (row_new, col_new) in self.map:
-                    surface.fill(self.colours2[count % 2])
-                    self.screen.blit(surface,
-                                     (self.offset[0] + self.size * col_new, self.offset[1] + self.size * row_new))
-                else:
-                    if (row, col) in self.highlighted:
-                        surface.fill(self.colours4[count % 2])
-                        self.screen.blit(surface,
-                                         (self.offset[0] + self.size * col_new, self.offset[1] + self.size * row_new))
-                    else:
-                        if len(self.last_move) != 0:
-                            if (row, col) in [square1, square2]:
-                                surface.fill(self.colours3[count % 2])
-                                self.screen.blit(surface,
-                                                 (self.offset[0] + self.size * col_new,
-                                                  self.offset[1] + self.size * row_new))
-                            else:
-                                surface.fill(self.colours[count % 2])
-                                self.screen.blit(surface,
-                                                 (self.offset[0] + self.size * col_new,
-                                                  self.offset[1] + self.size * row_new))
-                        else:
-                            surface.fill(self.colours[count % 2])
-                            self.screen.blit(surface,
-                                             (self.offset[0] + self.size * col_new,
-                                              self.offset[1] + self.size * row_new))
-                count += 1
-            count += 1
+        screen = self.screen
+        offset = self.offset
+        size = self.size
+        flipped = self.flipped
+        screen.blit(self.background, (0, 0))
+        screen.blit(self.plain_board(), (offset[0], offset[1]))
+        # colours of the squares not drawn in the plain board colours, later entries taking priority
+        square_colours = {}
+        if len(self.last_move) != 0:
+            move = self.last_move[-1]
+            if self.last_move_squares[0] != move:
+                self.last_move_squares = (move, square_on(move[0:2]), square_on(move[2:4]))
+            square_colours[self.last_move_squares[1]] = self.colours3
+            square_colours[self.last_move_squares[2]] = self.colours3
+        for square in self.highlighted:
+            square_colours[square] = self.colours4
+        if self.debug:
+            for row, col in self.map:
+                square_colours[(7 - row, 7 - col) if flipped else (row, col)] = self.colours2
+
+        # redraw only the coloured squares over the plain board
+        xs, ys = self.square_coords()
+        for (row, col), colours in square_colours.items():
+            if -1 < row < 8 and -1 < col < 8:
+                x, y = xs[col], ys[row]
+                screen.blit(self.board_background, (x, y),
+                            (x - offset[0], y - offset[1], size, size))
+                screen.blit(self.square_surface(colours[(row + col + 1) % 2]), (x, y))
 
         # draw letters + numbers
         if self.show_numbers:
+            labels = []
             for i in range(8):
                 number = 8 - i
-                if self.flipped:
+                if flipped:
                     number = -number + 9
-                surface = self.font.render(str(number), False, (255, 255, 255))
-                self.screen.blit(surface, (self.offset[0] - self.size / 2,
-                                           self.offset[1] + self.size / 2 + self.size * i - 13))  # draw numbers
+                labels.append((self.render_text(str(number)),
+                               (offset[0] - size / 2,
+                                offset[1] + size / 2 + size * i - 13)))  # draw numbers
             for i in range(8):
                 letter = board_letters[i]
-                if self.flipped:
+                if flipped:
                     letter = board_letters[7 - i]
-                surface = self.font.render(str(letter), False, (255, 255, 255))
-                self.screen.blit(surface, (self.offset[0] + self.size / 2 - 8 + self.size * i,
-                                           self.offset[
-                                               1] + 17 * self.size / 2 - 25))  # draw letters
-            surface = self.font.render('Settings = ESC', False, (255, 255, 255))
-            self.screen.blit(surface, (20, 20))
+                labels.append((self.render_text(str(letter)),
+                               (offset[0] + size / 2 - 8 + size * i,
+                                offset[1] + 17 * size / 2 - 25)))  # draw letters
+            labels.append((self.render_text('Settings = ESC'), (20, 20)))
+            screen.blits(labels, doreturn=False)
             if self.evaluation != '':
-                surface = self.font.render(self.evaluation, False, (255, 255, 255))
-                self.screen.blit(surface, (self.screen.get_width() / 2 - surface.get_width() / 2, 20))
+                surface = self.render_text(self.evaluation)
+                screen.blit(surface, (screen.get_width() / 2 - surface.get_width() / 2, 20))
 
             if self.best_move != '':
-                surface = self.font.render('Hint: ' + self.best_move, False, (255, 255, 255))
-                self.screen.blit(surface, (self.screen.get_width() - surface.get_width() - 10, 20))
+                surface = self.render_text('Hint: ' + self.best_move)
+                screen.blit(surface, (screen.get_width() - surface.get_width() - 10, 20))
+
+    def plain_board(self) -> pg.Surface:
+        """
+        Board image with every square drawn in the plain board colours, rebuilt when the board is resized or restyled
+        :return: Surface of the whole board
+        """
+        background, colours, size, surface = self.plain_board_cache
+        if background is not self.board_background or colours != self.colours or size != self.size:
+            surface = self.board_background.copy()
+            for row in range(8):
+                for col in range(8):
+                    surface.blit(self.square_surface(self.colours[(row + col + 1) % 2]),
+                                 (self.size * col, self.size * row))
+            self.plain_board_cache = (self.board_background, list(self.colours), self.size, surface)
+        return surface
+
+    def square_coords(self) -> tuple[list, list]:
+        """
+        Screen position of each board column and row, rebuilt only when the board is resized, moved or flipped
+        :return: x of each column, y of each row
+        """
+        key = (self.size, self.offset[0], self.offset[1], self.flipped)
+        if self.square_coords_cache[0] != key:
+            order = range(7, -1, -1) if self.flipped else range(8)
+            self.square_coords_cache = (key,
+                                        [self.offset[0] + self.size * i for i in order],
+                                        [self.offset[1] + self.size * i for i in order])
+        return self.square_coords_cache[1], self.square_coords_cache[2]
+
+    def square_surface(self, colour: tuple) -> pg.Surface:
+        """
+        Translucent board square filled with the given colour, reused until the board is resized
+        :param colour: RGB colour of the square
+        :return: Surface of one board square
+        """
+        surface = self.square_surfaces.get(colour)
+        if surface is None or surface.get_width() != self.size:
+            surface = pg.Surface((self.size, self.size))
+            surface.set_alpha(200)
+            surface.fill(colour)
+            self.square_surfaces[colour] = surface
+        return surface
+
+    def render_text(self, text: str) -> pg.Surface:
+        """
+        Render white text in the board font, reusing the surface if the same text has been drawn before
+        :param text: text to render
+        :return: Surface of the rendered text
+        """
+        surface = self.text_surfaces.get(text)
+        if surface is None:
+            if len(self.text_surfaces) >= TEXT_CACHE_SIZE:
+                self.text_surfaces.clear()
+            surface = self.font.render(text, False, (255, 255, 255))
+            self.text_surfaces[text] = surface
+        return surface
 
     def draw_pieces(self, piece_selected: Piece = None):
         """
@@ -1067,9 +1190,8 @@ class Engine:
         :param piece_selected:
         :return:
         """
-        for piece in self.all_pieces:
-            if piece != piece_selected:
-                piece.draw(self.offset, self.screen, self.size, self.flipped)
+        self.screen.blits([piece.blit_args(self.offset, self.size, self.flipped)
+                           for piece in self.all_pieces if piece != piece_selected], doreturn=False)
 
         # Draw the piece last, if it is being clicked/dragged
         if piece_selected is not None:
@@ -1077,136 +1199,146 @@ class Engine:
 
         self.draw_arrows()
 
+    def arrow_layer(self) -> pg.Surface:
+        """
+        Cleared window sized surface to draw one arrow on, reused until the window is resized
+        :return: Transparent surface the size of the window
+        """
+        size = pg.display.get_window_size()
+        if self.arrow_surface is None or self.arrow_surface.get_size() != size:
+            self.arrow_surface = pg.Surface(size, pg.SRCALPHA)
+            self.arrow_surface.set_alpha(200)
+        else:
+            self.arrow_surface.fill((0, 0, 0, 0))
+        return self.arrow_surface
+
     def draw_arrows(self):
-        off = (self.offset[0] + self.size / 2, self.offset[1] + self.size / 2)
+        size = self.size
+        width = int(size / 6)
+        colour = self.arrow_colour
+        draw_line = pg.draw.line
+        flipped = self.flipped
+        off = (self.offset[0] + size / 2, self.offset[1] + size / 2)
         for start, end in self.arrows:
             diff = (end[0] - start[0], end[1] - start[1])
-            surface = pg.Surface((pg.display.get_window_size()[0], pg.display.get_window_size()[1]), pg.SRCALPHA)
-            surface.set_alpha(200)
-            angle = math.atan2(((off[1] + self.size * start[0]) - (off[1] + self.size * end[0])),
-                               ((off[0] + self.size * start[1]) - (off[0] + self.size * end[1])))
+            surface = self.arrow_layer()
+            angle = math.atan2(((off[1] + size * start[0]) - (off[1] + size * end[0])),
+                               ((off[0] + size * start[1]) - (off[0] + size * end[1])))
             # Knight arrows !
             if diff in self.knight_moves:
                 if diff[0] in [2, -2]:
-                    if self.flipped:
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * (7 - start[1]), off[1] + self.size * (7 - start[0])),
-                                     (off[0] + self.size * (7 - start[1]), off[1] + self.size * (7 - start[0] - diff[0]) - (0.5*diff[0]*(int(self.size/6)/2))),
-                                     int(self.size / 6))
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * (7 - start[1]),
-                                      off[1] + self.size * (7 - start[0] - diff[0])),
-                                     (off[0] + self.size * (7 - start[1] - diff[1]) + self.size*diff[1]/5,
-                                      off[1] + self.size * (7 - start[0] - diff[0])),
-                                     int(self.size / 6))
-                        end_pos = (off[0] + self.size * (7 - start[1] - diff[1]),
-                                      off[1] + self.size * (7 - start[0] - diff[0]))
+                    if flipped:
+                        draw_line(surface, colour,
+                                  (off[0] + size * (7 - start[1]), off[1] + size * (7 - start[0])),
+                                  (off[0] + size * (7 - start[1]), off[1] + size * (7 - start[0] - diff[0]) - (0.5*diff[0]*(width/2))),
+                                  width)
+                        draw_line(surface, colour,
+                                  (off[0] + size * (7 - start[1]),
+                                   off[1] + size * (7 - start[0] - diff[0])),
+                                  (off[0] + size * (7 - start[1] - diff[1]) + size*diff[1]/5,
+                                   off[1] + size * (7 - start[0] - diff[0])),
+                                  width)
+                        end_pos = (off[0] + size * (7 - start[1] - diff[1]),
+                                      off[1] + size * (7 - start[0] - diff[0]))
                         angle = math.atan2(0, -diff[1])
-                        pg.draw.polygon(surface,
-                                        self.arrow_colour,
-                                        [end_pos,
-                                         (end_pos[0] - math.cos(angle + math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle + math.radians(30)) * self.size / 3),
-                                         (end_pos[0] - math.cos(angle - math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle - math.radians(30)) * self.size / 3)])
+                        self.draw_arrow_head(surface, end_pos, angle)
                     else:
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * start[1], off[1] + self.size * start[0]),
-                                     (off[0] + self.size * start[1], off[1] + self.size * (start[0] + diff[0]) + (0.5*diff[0]*(int(self.size/6)/2))),
-                                     int(self.size / 6))
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * start[1], off[1] + self.size * (start[0] + diff[0])),
-                                     (off[0] + self.size * (start[1] + diff[1]) - self.size*diff[1]/5, off[1] + self.size * (start[0] + diff[0])),
-                                     int(self.size / 6))
-                        end_pos = (off[0] + self.size * (start[1] + diff[1]), off[1] + self.size * (start[0] + diff[0]))
+                        draw_line(surface, colour,
+                                  (off[0] + size * start[1], off[1] + size * start[0]),
+                                  (off[0] + size * start[1], off[1] + size * (start[0] + diff[0]) + (0.5*diff[0]*(width/2))),
+                                  width)
+                        draw_line(surface, colour,
+                                  (off[0] + size * start[1], off[1] + size * (start[0] + diff[0])),
+                                  (off[0] + size * (start[1] + diff[1]) - size*diff[1]/5, off[1] + size * (start[0] + diff[0])),
+                                  width)
+                        end_pos = (off[0] + size * (start[1] + diff[1]), off[1] + size * (start[0] + diff[0]))
                         angle = math.atan2(0, diff[1])
-                        pg.draw.polygon(surface,
-                                        self.arrow_colour,
-                                        [end_pos,
-                                         (end_pos[0] - math.cos(angle + math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle + math.radians(30)) * self.size / 3),
-                                         (end_pos[0] - math.cos(angle - math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle - math.radians(30)) * self.size / 3)])
+                        self.draw_arrow_head(surface, end_pos, angle)
 
                 else:
-                    if self.flipped:
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * (7 - start[1]), off[1] + self.size * (7 - start[0])),
-                                     (off[0] + self.size * (7 - start[1] - diff[1]) - (0.5*diff[1]*(int(self.size/6)/2)),
-                                      off[1] + self.size * (7 - start[0])),
-                                     int(self.size / 6))
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * (7 - start[1] - diff[1]),
-                                      off[1] + self.size * (7 - start[0])),
-                                     (off[0] + self.size * (7 - start[1] - diff[1]),
-                                      off[1] + self.size * (7 - start[0] - diff[0]) + self.size*diff[0]/5),
-                                     int(self.size / 6))
-                        end_pos = (off[0] + self.size * (7 - start[1] - diff[1]),
-                                      off[1] + self.size * (7 - start[0] - diff[0]))
+                    if flipped:
+                        draw_line(surface, colour,
+                                  (off[0] + size * (7 - start[1]), off[1] + size * (7 - start[0])),
+                                  (off[0] + size * (7 - start[1] - diff[1]) - (0.5*diff[1]*(width/2)),
+                                   off[1] + size * (7 - start[0])),
+                                  width)
+                        draw_line(surface, colour,
+                                  (off[0] + size * (7 - start[1] - diff[1]),
+                                   off[1] + size * (7 - start[0])),
+                                  (off[0] + size * (7 - start[1] - diff[1]),
+                                   off[1] + size * (7 - start[0] - diff[0]) + size*diff[0]/5),
+                                  width)
+                        end_pos = (off[0] + size * (7 - start[1] - diff[1]),
+                                      off[1] + size * (7 - start[0] - diff[0]))
                         angle = math.atan2(-diff[0], 0)
-                        pg.draw.polygon(surface,
-                                        self.arrow_colour,
-                                        [end_pos,
-                                         (end_pos[0] - math.cos(angle + math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle + math.radians(30)) * self.size / 3),
-                                         (end_pos[0] - math.cos(angle - math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle - math.radians(30)) * self.size / 3)])
+                        self.draw_arrow_head(surface, end_pos, angle)
                     else:
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * start[1], off[1] + self.size * start[0]),
-                                     (off[0] + self.size * (start[1] + diff[1]) + (0.5*diff[1]*(int(self.size/6)/2)), off[1] + self.size * start[0]),
-                                     int(self.size / 6))
-                        pg.draw.line(surface, self.arrow_colour,
-                                     (off[0] + self.size * (start[1] + diff[1]), off[1] + self.size * start[0]),
-                                     (off[0] + self.size * (start[1] + diff[1]), off[1] + self.size * (start[0] + diff[0]) - self.size*diff[0]/5),
-                                     int(self.size / 6))
-                        end_pos = (off[0] + self.size * (start[1] + diff[1]), off[1] + self.size * (start[0] + diff[0]))
+                        draw_line(surface, colour,
+                                  (off[0] + size * start[1], off[1] + size * start[0]),
+                                  (off[0] + size * (start[1] + diff[1]) + (0.5*diff[1]*(width/2)), off[1] + size * start[0]),
+                                  width)
+                        draw_line(surface, colour,
+                                  (off[0] + size * (start[1] + diff[1]), off[1] + size * start[0]),
+                                  (off[0] + size * (start[1] + diff[1]), off[1] + size * (start[0] + diff[0]) - size*diff[0]/5),
+                                  width)
+                        end_pos = (off[0] + size * (start[1] + diff[1]), off[1] + size * (start[0] + diff[0]))
                         angle = math.atan2(diff[0], 0)
-                        pg.draw.polygon(surface,
-                                        self.arrow_colour,
-                                        [end_pos,
-                                         (end_pos[0] - math.cos(angle + math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle + math.radians(30)) * self.size / 3),
-                                         (end_pos[0] - math.cos(angle - math.radians(30)) * self.size / 3,
-                                          end_pos[1] - math.sin(angle - math.radians(30)) * self.size / 3)])
+                        self.draw_arrow_head(surface, end_pos, angle)
             # all other arrows
             else:
-                if self.flipped:
-                    # angle = math.atan2(((off[0] + self.size * (7 - start[1])) - (off[0] + self.size * (7 - end[1]))), ((off[1] + self.size * (7 - start[0])) - (off[1] + self.size * (7 - end[0]))))
-                    pg.draw.line(surface, self.arrow_colour,
-                                 (off[0] + self.size * (7 - start[1]), off[1] + self.size * (7 - start[0])),
-                                 (off[0] + self.size * (7 - end[1]) - self.size*math.cos(angle)/5, off[1] + self.size * (7 - end[0]) - self.size*math.sin(angle)/5), int(self.size/6))
-                    end_pos = (off[0] + self.size * (7 - end[1]), off[1] + self.size * (7 - end[0]))
+                if flipped:
+                    # angle = math.atan2(((off[0] + size * (7 - start[1])) - (off[0] + size * (7 - end[1]))), ((off[1] + size * (7 - start[0])) - (off[1] + size * (7 - end[0]))))
+                    draw_line(surface, colour,
+                              (off[0] + size * (7 - start[1]), off[1] + size * (7 - start[0])),
+                              (off[0] + size * (7 - end[1]) - size*math.cos(angle)/5, off[1] + size * (7 - end[0]) - size*math.sin(angle)/5), width)
+                    end_pos = (off[0] + size * (7 - end[1]), off[1] + size * (7 - end[0]))
                 else:
-                    pg.draw.line(surface, self.arrow_colour, (off[0] + self.size * start[1], off[1] + self.size * start[0]),
-                                 (off[0] + self.size * end[1] + self.size*math.cos(angle)/5, off[1] + self.size * end[0] + self.size*math.sin(angle)/5),  int(self.size/6))
-                    end_pos = (off[0] + self.size * end[1], off[1] + self.size * end[0])
-                if self.flipped:
-                    pg.draw.polygon(surface,
-                                    self.arrow_colour,
-                                    [end_pos,
-                                     (end_pos[0] - math.cos(angle + math.radians(30)) * self.size / 3,
-                                      end_pos[1] - math.sin(angle + math.radians(30)) * self.size / 3),
-                                     (end_pos[0] - math.cos(angle - math.radians(30)) * self.size / 3,
-                                      end_pos[1] - math.sin(angle - math.radians(30)) * self.size / 3)])
+                    draw_line(surface, colour, (off[0] + size * start[1], off[1] + size * start[0]),
+                              (off[0] + size * end[1] + size*math.cos(angle)/5, off[1] + size * end[0] + size*math.sin(angle)/5),  width)
+                    end_pos = (off[0] + size * end[1], off[1] + size * end[0])
+                if flipped:
+                    self.draw_arrow_head(surface, end_pos, angle)
                 else:
-                    pg.draw.polygon(surface,
-                                    self.arrow_colour,
-                                    [end_pos,
-                                     (end_pos[0] + math.cos(angle + math.radians(30)) * self.size / 3,
-                                      end_pos[1] + math.sin(angle + math.radians(30)) * self.size / 3),
-                                     (end_pos[0] + math.cos(angle - math.radians(30)) * self.size / 3,
-                                      end_pos[1] + math.sin(angle - math.radians(30)) * self.size / 3)])
+                    self.draw_arrow_head(surface, end_pos, angle, 1)
             self.screen.blit(surface, (0, 0))
 
+    def draw_arrow_head(self, surface, end_pos, angle, sign=-1):
+        """
+        Draw the triangular head of an arrow pointing along angle. Corner offsets are reused until the board is resized
+        :param surface: surface to draw on
+        :param end_pos: tip of the arrow
+        :param angle: direction of the arrow shaft in radians
+        :param sign: -1 to draw the head back from the tip, 1 to draw it forward
+        :return:
+        """
+        if self.arrow_head_cache[0] != self.size:
+            self.arrow_head_cache = (self.size, {})
+        offsets = self.arrow_head_cache[1].get((angle, sign))
+        if offsets is None:
+            left = angle + _ARROW_HEAD_ANGLE
+            right = angle - _ARROW_HEAD_ANGLE
+            offsets = (sign * (math.cos(left) * self.size / 3), sign * (math.sin(left) * self.size / 3),
+                       sign * (math.cos(right) * self.size / 3), sign * (math.sin(right) * self.size / 3))
+            self.arrow_head_cache[1][(angle, sign)] = offsets
+        pg.draw.polygon(surface,
+                        self.arrow_colour,
+                        [end_pos,
+                         (end_pos[0] + offsets[0], end_pos[1] + offsets[1]),
+                         (end_pos[0] + offsets[2], end_pos[1] + offsets[3])])
+
     def flip_enable(self, value):
         if value == 1:
             self.flip_enabled = True
         else:
             self.flip_enabled = False
 
+    def vsync_enable(self, value):
+        if (value == 1) != self.vsync_enabled:
+            self.vsync_enabled = value == 1
+            self.screen = self.set_display_mode(self.screen.get_width(), self.screen.get_height())
+
     def sounds_enable(self, value):
-        if value == 1:
+        if value == 1 and self.sounds:
             self.sound_enabled = True
         else:
             self.sound_enabled = False
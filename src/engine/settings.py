@@ -91,6 +91,9 @@ class SettingsMenu(pm.menu.Menu):
         self.sounds = self.add.toggle_switch('', int(lines[5]), cursor=11)
         self.sounds.set_controller(custom_controller)
 
+        self.label3 = self.add.label('VSync:')
+        self.vsync = self.add.toggle_switch('', int(lines[6]) if len(lines) > 6 else 1, cursor=11)
+        self.vsync.set_controller(custom_controller)
 
         self.label3 = self.add.label('Pieces:')
         self.piece = self.add.dropselect('', self.pieces, int(lines[1].replace('\n', '')), selection_box_width=350, selection_option_font_size=None, placeholder='Select Piece Type', selection_box_height=6, cursor=11)
@@ -131,6 +134,7 @@ class SettingsMenu(pm.menu.Menu):
         self.parent.change_ai_strength(self.strength.get_value()[0][1])
         self.parent.flip_enable(int(self.flip.get_value()))
         self.parent.sounds_enable(int(self.sounds.get_value()))
+        self.parent.vsync_enable(int(self.vsync.get_value()))
         with open('data/settings/settings.txt', 'w') as file:
             file.writelines(str(self.mode.get_index())+'\n')
             file.writelines(str(self.piece.get_index())+'\n')
@@ -138,6 +142,7 @@ class SettingsMenu(pm.menu.Menu):
             file.writelines(str(self.strength.get_index())+'\n')
             file.writelines(str(int(self.flip.get_value()))+'\n')
             file.writelines(str(int(self.sounds.get_value()))+'\n')
+            file.writelines(str(int(self.vsync.get_value()))+'\n')
         self.mode.get_index()
         self.exit_menu()
 
@@ -213,16 +218,22 @@ class EndGameMenu(pm.menu.Menu):
         self.button.set_controller(custom_controller)
         self.resized = False
         self.file_path = None
+        self.saved = None
 
     def run(self):
         self.enable()
         self.mainloop(self.screen, self.resize_event, fps_limit=120)
 
-    def set_file_path_and_text(self, path, text):
+    def set_file_path_and_text(self, path, text, saved=None):
         self.add.label(text, max_char=1000)
         self.file_path = path
+        self.saved = saved
 
     def view_file(self):
+        # the PGN is written on the io thread, so make sure it is on disk before opening it.
+        # A failed write has already been reported, so there is nothing to open
+        if self.saved is not None and self.saved.exception() is not None:
+            return
         os.system('notepad ' + self.file_path)
 
     def resize_event(self):
@@ -6,6 +6,9 @@ from src.pieces.knight import Knight
 from src.pieces.pawn import Pawn
 
 board_letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+# Board index of every square in algebraic notation, e.g. 'a1' -> (7, 0)
+board_squares = {letter + str(rank): (8 - rank, col)
+                 for col, letter in enumerate(board_letters) for rank in range(1, 9)}
 
 
 def create_FEN(board, turn, castle_rights, en_p_s, fmn):
@@ -55,7 +58,7 @@ def take_one(moves: str):
 
 def square_on(number):
     """Convert notation to board index. e.g. a1 -> (7, 0)"""
-    return tuple((7 - (int(number[1]) - 1), int(board_letters.index(number[0]))))
+    return board_squares[number]
 
 
 def translate_move(r, c, x, y):
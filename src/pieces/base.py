@@ -5,13 +5,59 @@ Common class for all pieces.
 import pygame as pg
 from pygame import sprite
 
+# (dx, dy) legal position of every step along a (row, col) direction, shared by the sliding pieces
+ray_offsets = {(dr, dc): tuple((dc * i, dr * i) for i in range(1, 9))
+               for dr in (-1, 0, 1) for dc in (-1, 0, 1)}
+# unscaled piece images, keyed by (piece set, colour letter, piece letter)
+pictures = {}
+# piece images scaled to the current square size, keyed like pictures. Cleared when the size changes
+scaled_pictures = {}
+scaled_size = None
+
+
+def load_picture(piece_set, colour, piece, size=None):
+    """Load a piece image, scaled to size if given. Each image is only read from disk once"""
+    global scaled_size
+    key = (piece_set, colour[0], piece.lower())
+    picture = pictures.get(key)
+    if picture is None:
+        picture = pg.image.load(
+            "data/img/pieces/" + piece_set + "/" + colour[0] + piece.lower() + ".png").convert_alpha()
+        pictures[key] = picture
+    if size is None:
+        return picture
+    if size != scaled_size:
+        # only the current board size is kept, so resizing the window does not pile up old scales
+        scaled_pictures.clear()
+        scaled_size = size
+    scaled = scaled_pictures.get(key)
+    if scaled is None:
+        scaled = pg.transform.smoothscale(picture, (size, size))
+        scaled_pictures[key] = scaled
+    return scaled
+
+
+# rounded square marking a capturable piece, for the current square size only
+capture_marks = {}
+
+
+def capture_mark(size):
+    """Rounded square drawn over a piece that can be captured. Only redrawn when the size changes"""
+    mark = capture_marks.get(size)
+    if mark is None:
+        mark = pg.Surface((int(2*size/3), int(2*size/3)), pg.SRCALPHA)
+        pg.draw.rect(mark, (237, 109, 100), mark.get_rect(), border_radius=int(size/8))
+        capture_marks.clear()
+        capture_marks[size] = mark
+    return mark
+
+
 class Piece(sprite.Sprite):
     """Base class for all pieces"""
     def __init__(self):
         """Initialize the piece"""
         super().__init__()
         self.piece_set = 'chessmonk'
-        self.dead = False
         self.position = None
         self.colour = None
         self.piece = None
@@ -24,6 +70,9 @@ class Piece(sprite.Sprite):
         self.size = 100
         self.is_alive = True
         self.has_moved = False
+        self.is_pawn = False
+        self.is_king = False
+        self.is_slider = False
         self.picture = None
 
     def click(self):
@@ -33,19 +82,24 @@ class Piece(sprite.Sprite):
     def show_legal_moves(self, screen, offset, turn, flipped, board):
         """If piece is clicked show legal moves"""
 
+        if turn != self.colour[0]:
+            return
         for i in self.legal_positions:
-            if board[(self.position[0] + i[1])][(self.position[1] + i[0])] == ' ':
-                if -1 < (self.position[1] + i[0]) < 8 and -1 < (self.position[0] + i[1]) < 8 and turn == self.colour[0]:
-                    if not flipped:
-                        pg.draw.circle(screen, (0, 204, 204), ((self.position[1] + i[0])*self.size + offset[0] + self.size/2, (self.position[0] + i[1])*self.size + offset[1] + self.size/2), self.size/4)
-                    else:
-                        pg.draw.circle(screen, (0, 204, 204), ((-self.position[1]+7 - i[0])*self.size + offset[0] + self.size/2, (-self.position[0]+7 - i[1])*self.size + offset[1] + self.size/2), self.size/4)
+            row = self.position[0] + i[1]
+            col = self.position[1] + i[0]
+            # check the square is on the board before looking it up
+            if not (-1 < col < 8 and -1 < row < 8):
+                continue
+            if board[row][col] == ' ':
+                if not flipped:
+                    pg.draw.circle(screen, (0, 204, 204), (col*self.size + offset[0] + self.size/2, row*self.size + offset[1] + self.size/2), self.size/4)
+                else:
+                    pg.draw.circle(screen, (0, 204, 204), ((7 - col)*self.size + offset[0] + self.size/2, (7 - row)*self.size + offset[1] + self.size/2), self.size/4)
             else:
-                if -1 < (self.position[1] + i[0]) < 8 and -1 < (self.position[0] + i[1]) < 8 and turn == self.colour[0]:
-                    if not flipped:
-                        pg.draw.rect(screen, (237, 109, 100), ((self.position[1] + i[0])*self.size + offset[0] + self.size/6, (self.position[0] + i[1])*self.size + offset[1] + self.size/6, 2*self.size/3, 2*self.size/3), border_radius=int(self.size/8))
-                    else:
-                        pg.draw.rect(screen, (237, 109, 100), ((-self.position[1]+7 - i[0])*self.size + offset[0] + self.size/6, (-self.position[0]+7 - i[1])*self.size + offset[1] + self.size/6, 2*self.size/3, 2*self.size/3), border_radius=int(self.size/8))
+                if not flipped:
+                    screen.blit(capture_mark(self.size), (int(col*self.size + offset[0] + self.size/6), int(row*self.size + offset[1] + self.size/6)))
+                else:
+                    screen.blit(capture_mark(self.size), (int((7 - col)*self.size + offset[0] + self.size/6), int((7 - row)*self.size + offset[1] + self.size/6)))
 
     def update_legal_moves(self, board, eps=None, captures=False):
         """Refresh legal moves"""
@@ -59,41 +113,32 @@ class Piece(sprite.Sprite):
         for direction in self.legal_directions:
             temp_check = []
             for i in range(1, 9):
-                try:
-                    piece = board[y + direction[0] * i][x + direction[1] * i]
-                    if -1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8:
-                        if piece == ' ':
-                            temp_check.append((y + direction[0] * i, x + direction[1] * i))
-                        elif piece.colour != self.colour and piece.piece.lower() == 'k':
-                            temp_check.append((y + direction[0] * i, x + direction[1] * i))
-                            temp_check.append(self.position)
-                            for i in temp_check:
-                                self.checks.append(i)
-                            return True
-                        else:
-                            break
-                    else:
-                        break
-                except:
-                    continue
+                if not (-1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8):
+                    break
+                piece = board[y + direction[0] * i][x + direction[1] * i]
+                if piece == ' ':
+                    temp_check.append((y + direction[0] * i, x + direction[1] * i))
+                elif piece.colour != self.colour and piece.piece.lower() == 'k':
+                    temp_check.append((y + direction[0] * i, x + direction[1] * i))
+                    temp_check.append(self.position)
+                    for i in temp_check:
+                        self.checks.append(i)
+                    return True
+                else:
+                    break
         return False
 
-    def trim_checks(self, board, turn, map=None, in_check=False):
+    def trim_checks(self, board, turn, map=None, in_check=False, checkers=None):
         """Trim legal moves based on Checks"""
+        if checkers is None:
+            checkers = [piece for row in board for piece in row
+                        if piece != ' ' and len(piece.checks) > 0 and piece.colour[0] != turn and not piece.is_king]
         updated_moves = []
-        for i, row in enumerate(board):
-            for j, piece in enumerate(row):
-                if piece != ' ':
-                    if len(piece.checks) > 0:
-                        if piece.colour[0] != turn:
-                            if piece.piece.lower() != 'k':
-                                for move in self.legal_positions:
-                                    # print('Piece, position moves: ')
-                                    # print(self.piece, self.position)
-                                    # print((self.position[0] + move[1], self.position[1] + move[0]))
-                                    if (self.position[0] + move[1], self.position[1] + move[0]) in piece.checks:
-                                        updated_moves.append(move)
-                                self.legal_positions = updated_moves
+        for piece in checkers:
+            for move in self.legal_positions:
+                if (self.position[0] + move[1], self.position[1] + move[0]) in piece.checks:
+                    updated_moves.append(move)
+            self.legal_positions = updated_moves
 
     def pin_line_update(self, board):
         """Calculate pieces in pinned positions"""
@@ -106,27 +151,23 @@ class Piece(sprite.Sprite):
             temp_pins = []
             piece_pinned = ''
             for i in range(1, 9):
-                try:
-                    piece = board[y + direction[0] * i][x + direction[1] * i]
-                    if -1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8:
-                        if piece == ' ':
-                            temp_pins.append((y + direction[0] * i, x + direction[1] * i))
-                        elif piece.colour != self.colour and count < 1:
-                            temp_pins.append((y + direction[0] * i, x + direction[1] * i))
-                            piece_pinned = piece.piece + str(piece.position)
-                            count += 1
-                        elif piece.colour != self.colour and piece.piece.lower() == 'k':
-                            for i in temp_pins:
-                                self.pin_lines.add(i)
-                            break
-                        elif piece.colour == self.colour:
-                            break
-                        else:
-                            break
-                    else:
-                        break
-                except:
-                    continue
+                if not (-1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8):
+                    break
+                piece = board[y + direction[0] * i][x + direction[1] * i]
+                if piece == ' ':
+                    temp_pins.append((y + direction[0] * i, x + direction[1] * i))
+                elif piece.colour != self.colour and count < 1:
+                    temp_pins.append((y + direction[0] * i, x + direction[1] * i))
+                    piece_pinned = piece.piece + str(piece.position)
+                    count += 1
+                elif piece.colour != self.colour and piece.piece.lower() == 'k':
+                    for i in temp_pins:
+                        self.pin_lines.add(i)
+                    break
+                elif piece.colour == self.colour:
+                    break
+                else:
+                    break
         # if len(self.pin_lines) > 1:
         #     print(self.piece, self.position, self.pin_lines)
 
@@ -140,7 +181,7 @@ class Piece(sprite.Sprite):
                     piece = board[pin[0]][pin[1]]
                     updated_moves = []
                     for legal_pos in piece.legal_positions:
-                        if (piece.position[0] + legal_pos[1], piece.position[1] + legal_pos[0]) in list(self.pin_lines):
+                        if (piece.position[0] + legal_pos[1], piece.position[1] + legal_pos[0]) in self.pin_lines:
                             updated_moves.append(legal_pos)
                     piece.legal_positions = updated_moves
             except:
@@ -150,8 +191,9 @@ class Piece(sprite.Sprite):
         """Move the pieces position on the board if legal"""
         # ai move's using i amd j
         if i == None:
-            x = int((pg.mouse.get_pos()[0] - offset[0]) // self.size)
-            y = int((pg.mouse.get_pos()[1] - offset[1]) // self.size)
+            mouse_x, mouse_y = pg.mouse.get_pos()
+            x = int((mouse_x - offset[0]) // self.size)
+            y = int((mouse_y - offset[1]) // self.size)
         else:
             x = i
             y = j
@@ -166,36 +208,32 @@ class Piece(sprite.Sprite):
         else:
             return False
 
-    def draw(self, offset, screen, size, flipped):
-        """Draw the current piece"""
+    def blit_args(self, offset, size, flipped):
+        """Picture of the piece at the board size, and where to blit it"""
         self.size = size
         if self.picture.get_size() != (self.size, self.size):
-            self.picture = pg.image.load(
-                "data/img/pieces/" + self.piece_set + "/" + self.colour[0] + self.piece.lower() + ".png").convert_alpha()
-            self.picture = pg.transform.smoothscale(self.picture, (self.size, self.size))
+            self.picture = load_picture(self.piece_set, self.colour, self.piece, self.size)
         if self.clicked:
-            screen.blit(self.picture,
-                        (pg.mouse.get_pos()[0] - self.size / 2 ,
-                         pg.mouse.get_pos()[1] - self.size / 2)
-                        )
-        else:
-            if not flipped:
-                screen.blit(self.picture,
-                        (offset[0] + self.size * self.position[1], offset[1] + self.size * self.position[0]))
-            else:
-                screen.blit(self.picture,
-                            (offset[0] + self.size * (-self.position[1]+7), offset[1] + self.size * (-self.position[0]+7)))
+            mouse_x, mouse_y = pg.mouse.get_pos()
+            return self.picture, (mouse_x - self.size / 2, mouse_y - self.size / 2)
+        if not flipped:
+            return self.picture, (offset[0] + self.size * self.position[1], offset[1] + self.size * self.position[0])
+        return self.picture, (offset[0] + self.size * (-self.position[1]+7), offset[1] + self.size * (-self.position[0]+7))
+
+    def draw(self, offset, screen, size, flipped):
+        """Draw the current piece"""
+        screen.blit(*self.blit_args(offset, size, flipped))
 
     def change_piece_set(self, piece_type):
         """Change piece set"""
+        if piece_type == self.piece_set:
+            return
         self.piece_set = piece_type
-        self.picture = pg.image.load(
-            "data/img/pieces/" + self.piece_set + "/" + self.colour[0] + self.piece.lower() + ".png").convert_alpha()
-        self.picture = pg.transform.smoothscale(self.picture, (self.size, self.size))
+        # load unscaled; blit_args() scales it to the board size on the next draw
+        self.picture = load_picture(self.piece_set, self.colour, self.piece)
 
     def __del__(self):
         """Delete the piece"""
-        self.dead = True
         self.clicked = False
         self.kill()
         # print('a', self.colour, self.piece.upper(), 'has died')
@@ -1,5 +1,4 @@
-from .base import Piece
-import pygame as pg
+from .base import Piece, load_picture
 
 
 class King(Piece):
@@ -8,6 +7,7 @@ class King(Piece):
         """Initialize the King class"""
         super().__init__(*args, *kwargs)
         self.castling_rights = castling_rights
+        self.is_king = True
         self.legal_directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (-1, 1), (1, -1)]
         self.colour = colour
         self.position = position
@@ -15,8 +15,7 @@ class King(Piece):
             self.piece = 'k'
         else:
             self.piece = 'K'
-        self.picture = pg.image.load(
-            "data/img/pieces/" + self.piece_set + "/" + colour[0] + self.piece.lower() + ".png").convert_alpha()
+        self.picture = load_picture(self.piece_set, colour, self.piece)
 
     def update_legal_moves(self, board, eps, captures):
         """Calculate the legal moves"""
@@ -34,6 +33,7 @@ class King(Piece):
                         self.legal_positions.append((direction[1], direction[0]))
             except:
                 continue
+        # castling_rights comes from the FEN the king was parsed from, so rights lost before an undo stay lost
         if not self.has_moved:
             blanks = 0
             try:
@@ -43,7 +43,7 @@ class King(Piece):
             except:
                 pass
             try:
-                if board[self.position[0]][self.position[1] + 3].piece.lower() == 'r' and board[self.position[0]][self.position[1] + 3].has_moved == False and blanks == 2:
+                if self.castling_rights['king'] and board[self.position[0]][self.position[1] + 3].piece.lower() == 'r' and board[self.position[0]][self.position[1] + 3].has_moved == False and blanks == 2:
                     self.legal_positions.append((2, 0))
             except:
                 pass
@@ -52,12 +52,12 @@ class King(Piece):
                 if board[self.position[0]][self.position[1] - i] == ' ':
                     blanks += 1
             try:
-                if board[self.position[0]][self.position[1] - 4].piece.lower() == 'r' and not board[self.position[0]][self.position[1] - 4].has_moved and blanks == 3:
+                if self.castling_rights['queen'] and board[self.position[0]][self.position[1] - 4].piece.lower() == 'r' and not board[self.position[0]][self.position[1] - 4].has_moved and blanks == 3:
                     self.legal_positions.append((-2, 0))
             except:
                 pass
 
-    def trim_checks(self, board, turn, map, in_check):
+    def trim_checks(self, board, turn, map, in_check, checkers=None):
         """Trim legal moves based on Checks"""
 
         updated_moves = []
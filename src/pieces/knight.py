@@ -1,5 +1,4 @@
-from .base import Piece
-import pygame as pg
+from .base import Piece, load_picture
 
 class Knight(Piece):
     """Knight Piece"""
@@ -13,8 +12,7 @@ class Knight(Piece):
             self.piece = 'n'
         else:
             self.piece = 'N'
-        self.picture = pg.image.load(
-            "data/img/pieces/" + self.piece_set + "/" + colour[0] + self.piece.lower() + ".png").convert_alpha()
+        self.picture = load_picture(self.piece_set, colour, self.piece)
 
     def update_legal_moves(self, board, eps, captures):
         """Calculate the legal moves"""
@@ -1,5 +1,4 @@
-from .base import Piece
-import pygame as pg
+from .base import Piece, load_picture
 
 
 class Pawn(Piece):
@@ -8,6 +7,7 @@ class Pawn(Piece):
         """Initialize the Pawn class"""
         super().__init__(*args, *kwargs)
         self.has_moved = has_moved
+        self.is_pawn = True
         self.colour = colour
         self.position = position
         if colour == 'black':
@@ -18,8 +18,7 @@ class Pawn(Piece):
             self.direction = -1
             self.piece = 'P'
             self.legal_directions = [(0, -1), (0, -2)]
-        self.picture = pg.image.load(
-            "data/img/pieces/" + self.piece_set + "/" + colour[0] + self.piece.lower() + ".png").convert_alpha()
+        self.picture = load_picture(self.piece_set, colour, self.piece)
 
     def update_legal_moves(self, board, eps, captures):
         """Calculate the legal moves"""
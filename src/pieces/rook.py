@@ -1,11 +1,11 @@
-from .base import Piece
-import pygame as pg
+from .base import Piece, load_picture, ray_offsets
 
 class Rook(Piece):
     """Rook Piece"""
     def __init__(self, position, colour, *args, **kwargs):
         """Initialize the Rook class"""
         super().__init__(*args, *kwargs)
+        self.is_slider = True
         self.legal_directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
         self.colour = colour
         self.position = position
@@ -14,8 +14,7 @@ class Rook(Piece):
             self.piece = 'r'
         else:
             self.piece = 'R'
-        self.picture = pg.image.load(
-            "data/img/pieces/" + self.piece_set + "/" + colour[0] + self.piece.lower() + ".png").convert_alpha()
+        self.picture = load_picture(self.piece_set, colour, self.piece)
 
     def update_legal_moves(self, board, eps, captures):
         """Calculate the legal moves"""
@@ -23,26 +22,23 @@ class Rook(Piece):
         x = self.position[1]
         y = self.position[0]
         for direction in self.legal_directions:
-            for i in range(1, 9):
-                try:
-                    if -1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8:
-                        if board[y + direction[0] * i][x + direction[1] * i] == ' ':
-                            self.legal_positions.append((direction[1] * i, direction[0] * i))
-                        elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and not captures:
-                            self.legal_positions.append((direction[1] * i, direction[0] * i))
-                            break
-                        elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and \
-                                board[y + direction[0] * i][x + direction[1] * i].piece.lower() == 'k' and captures:
-                            self.legal_positions.append((direction[1] * i, direction[0] * i))
-                        elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and captures:
-                            self.legal_positions.append((direction[1] * i, direction[0] * i))
-                            break
-                        elif board[y + direction[0] * i][x + direction[1] * i].colour == self.colour and captures:
-                            self.legal_positions.append((direction[1] * i, direction[0] * i))
-                            break
-                        else:
-                            break
-                except:
-                    continue
+            for i, move in enumerate(ray_offsets[direction], 1):
+                if -1 < y + direction[0] * i < 8 and -1 < x + direction[1] * i < 8:
+                    if board[y + direction[0] * i][x + direction[1] * i] == ' ':
+                        self.legal_positions.append(move)
+                    elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and not captures:
+                        self.legal_positions.append(move)
+                        break
+                    elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and \
+                            board[y + direction[0] * i][x + direction[1] * i].piece.lower() == 'k' and captures:
+                        self.legal_positions.append(move)
+                    elif board[y + direction[0] * i][x + direction[1] * i].colour != self.colour and captures:
+                        self.legal_positions.append(move)
+                        break
+                    elif board[y + direction[0] * i][x + direction[1] * i].colour == self.colour and captures:
+                        self.legal_positions.append(move)
+                        break
+                    else:
+                        break
 
 